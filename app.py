@@ -1,26 +1,91 @@
 from __future__ import annotations
+import os
 import streamlit as st
 import pandas as pd
-from transformers import pipeline
+import numpy as np
 import matplotlib.pyplot as plt
 from pathlib import Path
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 # Nastavitve poti
 DATA_DIR = Path("data")
 
+# Od te velikosti naprej na CPU razdelimo napovedi med več procesov
+PARALLEL_MIN_TEXTS = 256
+
 # 1. Funkcije za nalaganje podatkov
-@st.cache_data
-def load_csv(name: str) -> pd.DataFrame:
-    p = DATA_DIR / name
-    if not p.exists():
-        return pd.DataFrame()
-    df = pd.read_csv(p)
+def load_table(name: str) -> pd.DataFrame:
+    # Najprej Parquet (ohrani tipe stolpcev), sicer starejši CSV
+    for p in (DATA_DIR / f"{name}.parquet", DATA_DIR / f"{name}.csv"):
+        if p.exists():
+            # mtime je del ključa, da se predpomnilnik osveži, ko scrape.py prepiše datoteko
+            return _load_table(str(p), p.stat().st_mtime)
+    return pd.DataFrame()
+
+@st.cache_data(persist="disk", show_spinner=False, max_entries=4)
+def _load_table(path: str, mtime: float) -> pd.DataFrame:
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, engine="pyarrow", dtype_backend="pyarrow")
+    df = pd.read_csv(path)
     return df
 
+def import_sentiment():
+    # torch/transformers naložimo šele, ko je model res potreben
+    # (sentiment je običajno že izračunan v scrape.py). Niti OpenMP/MKL
+    # omejimo, preden se naloži torch (numpy je takrat že naložen).
+    os.environ.setdefault("OMP_NUM_THREADS", "4")
+    os.environ.setdefault("MKL_NUM_THREADS", "4")
+    import sentiment
+    sentiment.set_threads()
+    return sentiment
+
+def n_workers() -> int:
+    return max(1, (os.cpu_count() or 1) // import_sentiment().THREADS_PER_WORKER)
+
 @st.cache_resource
-def get_sentiment_pipe():
+def get_sentiment_model():
     # Model DistilBERT za analizo sentimenta [cite: 29]
-    return pipeline("sentiment-analysis", model="distilbert-base-uncased-finetuned-sst-2-english")
+    sentiment = import_sentiment()
+    return sentiment.load_model(num_threads=sentiment.THREADS_PER_WORKER)
+
+@st.cache_resource
+def get_worker_pool() -> ProcessPoolExecutor:
+    # Vsak proces enkrat naloži svoj model (init_worker)
+    return ProcessPoolExecutor(
+        max_workers=n_workers(),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=import_sentiment().init_worker,
+    )
+
+@st.cache_data(show_spinner=False)
+def predict_sentiments(texts: tuple[str, ...], batch_size: int = 32) -> list[dict]:
+    # Napovedi so na disku po sha1(text), model poženemo le za manjkajoče
+    sentiment = import_sentiment()
+
+    def predict(missing: list[str]) -> list[dict]:
+        # Velike količine na CPU razdelimo med procese, sicer en sam model
+        workers = n_workers()
+        if workers > 1 and len(missing) >= PARALLEL_MIN_TEXTS and sentiment.backend_name() != "cuda-fp16":
+            return sentiment.predict_sentiment_parallel(get_worker_pool(), workers, missing, batch_size=batch_size)
+        return sentiment.predict_sentiment(missing, *get_sentiment_model(), batch_size=batch_size)
+
+    return sentiment.predict_with_cache(list(texts), predict)
+
+@st.cache_data(show_spinner=False)
+def prepare_reviews(df: pd.DataFrame) -> tuple[pd.DataFrame, dict[pd.Period, np.ndarray]]:
+    # Priprava datumov [cite: 14] (Parquet jih že hrani kot timestamp)
+    if not pd.api.types.is_datetime64_any_dtype(df["date"]):
+        df = df.assign(date=pd.to_datetime(df["date"], errors="coerce"))
+    df = df.dropna(subset=["date"]).reset_index(drop=True)
+
+    # Indekse vrstic za vsak mesec izračunamo enkrat (ključ: leto*12 + mesec)
+    key = (df["date"].dt.year * 12 + df["date"].dt.month - 1).to_numpy(dtype=np.int64)
+    group_indices = {
+        pd.Period(year=int(k) // 12, month=int(k) % 12 + 1, freq="M"): np.flatnonzero(key == k)
+        for k in np.unique(key)
+    }
+    return df, group_indices
 
 def month_options_2023():
     return pd.period_range("2023-01", "2023-12", freq="M")
@@ -34,7 +99,7 @@ def main():
     section = st.sidebar.radio("Navigacija", ["Izdelki", "Pričevanja", "Mnenja (Reviews)"])
 
     if section == "Izdelki":
-        df = load_csv("products.csv")
+        df = load_table("products")
         st.subheader("Seznam izdelkov")
         if not df.empty:
             st.dataframe(df, use_container_width=True)
@@ -42,7 +107,7 @@ def main():
             st.warning("Podatki o izdelkih niso na voljo. Najprej zaženite scrape.py.")
 
     elif section == "Pričevanja":
-        df = load_csv("testimonials.csv")
+        df = load_table("testimonials")
         st.subheader("Pričevanja strank")
         if not df.empty:
             st.dataframe(df, use_container_width=True)
@@ -50,17 +115,16 @@ def main():
             st.warning("Podatki o pričevanjih niso na voljo.")
 
     else:
-        df = load_csv("reviews.csv")
+        df = load_table("reviews")
         st.subheader("Analiza sentimenta mnenj (2023)")
+        batch_size = st.sidebar.number_input("Velikost paketa (batch size)", min_value=1, max_value=256, value=32, step=8)
 
         if df.empty:
-            st.error("Datoteka reviews.csv ne obstaja ali je prazna!")
+            st.error("Podatki o mnenjih (reviews.parquet ali reviews.csv) ne obstajajo ali so prazni!")
             return
 
-        # Priprava datumov [cite: 14]
-        df["date"] = pd.to_datetime(df["date"], errors="coerce")
-        df = df.dropna(subset=["date"])
-        
+        df, group_indices = prepare_reviews(df)
+
         # Izbira meseca z drsnikom [cite: 25]
         months = month_options_2023()
         month_labels = [m.strftime("%b %Y") for m in months]
@@ -68,7 +132,7 @@ def main():
 
         # Filtriranje [cite: 26]
         selected_period = pd.Period(selected_label, freq="M")
-        month_df = df[df["date"].dt.to_period("M") == selected_period].copy()
+        month_df = df.iloc[group_indices.get(selected_period, np.empty(0, dtype=np.int64))].copy()
 
         st.write(f"Število mnenj za **{selected_label}**: {len(month_df)}")
 
@@ -76,34 +140,45 @@ def main():
             st.info("V tem mesecu ni mnenj. Izberite drug mesec.")
             return
 
-        # Sentiment analiza s Transformers [cite: 27, 29]
-        pipe = get_sentiment_pipe()
-        with st.spinner("Analiziram sentiment..."):
-            texts = month_df["text"].fillna("").astype(str).tolist()
-            preds = pipe(texts)
+        # Sentiment je običajno že izračunan v scrape.py, sicer ga izračunamo tukaj [cite: 27, 29]
+        if not {"sentiment", "confidence"}.issubset(month_df.columns):
+            with st.spinner("Analiziram sentiment..."):
+                texts = tuple(month_df["text"].fillna("").astype(str))
+                preds = predict_sentiments(texts, batch_size=int(batch_size))
 
-        month_df["sentiment"] = [p["label"] for p in preds]
-        month_df["confidence"] = [float(p["score"]) for p in preds]
+            month_df["sentiment"] = [p["label"] for p in preds]
+            month_df["confidence"] = [float(p["score"]) for p in preds]
 
         # Prikaz tabele [cite: 23, 31]
         st.dataframe(month_df[["date", "text", "sentiment", "confidence"]], use_container_width=True)
 
         # Vizualizacija [cite: 33, 35]
         st.markdown("### Statistika sentimenta")
-        summary = month_df.groupby("sentiment").agg(
-            count=("sentiment", "size"),
-            avg_conf=("confidence", "mean")
-        ).reset_index()
-
-        fig, ax = plt.subplots()
-        bars = ax.bar(summary["sentiment"], summary["count"], color=['#ff9999','#66b3ff'])
-        ax.set_ylabel("Število mnenj")
-        
-        # Dodajanje confidence score v graf [cite: 35]
-        for i, row in summary.iterrows():
-            ax.text(i, row["count"], f"Zaupanje: {row['avg_conf']:.2%}", ha='center', va='bottom')
-        
-        st.pyplot(fig)
+        counts = month_df["sentiment"].value_counts().sort_index()
+        avg_conf = month_df.groupby("sentiment")["confidence"].mean().reindex(counts.index)
+        summary = pd.DataFrame({
+            "sentiment": counts.index,
+            "count": counts.to_numpy(),
+            "avg_conf": avg_conf.to_numpy(),
+        })
+
+        # Graf se izriše v brskalniku (brez Matplotlib/PNG na strežniku)
+        st.bar_chart(summary.set_index("sentiment")["count"], y_label="Število mnenj")
+
+        # Povprečno zaupanje (confidence score) po sentimentu [cite: 35]
+        st.dataframe(summary.style.format({"avg_conf": "{:.2%}"}), hide_index=True)
+
+        if st.checkbox("Prikaži Matplotlib graf"):
+            fig, ax = plt.subplots()
+            ax.bar(summary["sentiment"], summary["count"], color=['#ff9999','#66b3ff'])
+            ax.set_ylabel("Število mnenj")
+
+            # Dodajanje confidence score v graf [cite: 35]
+            for i, (cnt, conf) in enumerate(zip(summary["count"].to_numpy(), summary["avg_conf"].to_numpy())):
+                ax.text(i, cnt, f"Zaupanje: {conf:.2%}", ha='center', va='bottom')
+
+            st.pyplot(fig)
+            plt.close(fig)
 
 if __name__ == "__main__":
     main()
@@ -1,13 +1,17 @@
 # scrape.py
 from __future__ import annotations
+import asyncio
 import re
-from datetime import datetime
 from pathlib import Path
 import time
 
+import hishel
+import httpx
+import orjson
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
+import pyarrow as pa
+import requests_cache
+from selectolax.lexbor import LexborHTMLParser
 
 BASE = "https://web-scraping.dev"
 OUT_DIR = Path("data")
@@ -17,27 +21,116 @@ HEADERS = {
     "User-Agent": "Mozilla/5.0 (compatible; HW3 bot; +https://example.com)"
 }
 
-def get_soup(url: str, headers: dict = None) -> BeautifulSoup:
-    req_headers = HEADERS.copy()
-    if headers:
-        req_headers.update(headers)
-    r = requests.get(url, headers=req_headers, timeout=30)
+# Explicit column types for the scraped tables
+PRODUCTS_SCHEMA = pa.schema([
+    ("name", pa.string()),
+    ("price", pa.string()),
+    ("link", pa.string()),
+    ("description", pa.string()),
+    ("category", pa.string()),
+])
+TESTIMONIALS_SCHEMA = pa.schema([
+    ("author", pa.string()),
+    ("text", pa.string()),
+    ("rating", pa.int64()),
+])
+REVIEWS_SCHEMA = pa.schema([
+    ("review_id", pa.string()),
+    ("product_url", pa.string()),
+    ("text", pa.string()),
+    ("rating", pa.int64()),
+    ("date_raw", pa.string()),
+])
+
+# Politeness: one limit for every crawl. Requests that reach the server are
+# started REQUEST_INTERVAL apart; the async product-page crawl additionally
+# caps the number of requests in flight
+REQUESTS_PER_SECOND = 4
+REQUEST_INTERVAL = 1 / REQUESTS_PER_SECOND
+MAX_IN_FLIGHT = 8
+
+class RateLimiter:
+    # Spaces request starts at least `interval` seconds apart
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.next_start = 0.0
+        self.lock = asyncio.Lock()
+
+    def wait(self):
+        delay = self.next_start - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_start = time.monotonic() + self.interval
+
+    async def wait_async(self):
+        # The lock serializes waiters, so concurrent tasks still start one
+        # request per interval
+        async with self.lock:
+            delay = self.next_start - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.next_start = time.monotonic() + self.interval
+
+class PoliteTransport(httpx.AsyncBaseTransport):
+    # Paces requests that go to the network; sits under the cache transport,
+    # so cache hits never reach it
+    def __init__(self, transport: httpx.AsyncBaseTransport, limiter: RateLimiter):
+        self.transport = transport
+        self.limiter = limiter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await self.limiter.wait_async()
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+# Shared session keeps connections alive and caches responses on disk
+# (honours ETag / Last-Modified), so repeat scrapes mostly skip the network
+SESSION = requests_cache.CachedSession(str(OUT_DIR / "http_cache"), expire_after=3600, cache_control=True)
+SESSION.headers.update(HEADERS)
+RATE_LIMITER = RateLimiter(REQUEST_INTERVAL)
+
+def get_soup(url: str, headers: dict = None) -> LexborHTMLParser:
+    r = SESSION.get(url, headers=headers, timeout=30)
     r.raise_for_status()
-    time.sleep(0.5)  # Be polite
-    return BeautifulSoup(r.text, "lxml")
-
-def parse_date(raw: str) -> datetime | None:
-    raw = raw.strip()
-    for fmt in ("%Y-%m-%d", "%d.%m.%Y", "%b %d, %Y", "%B %d, %Y", "%Y-%m-%d %H:%M:%S"):
-        try:
-            return datetime.strptime(raw, fmt)
-        except ValueError:
-            pass
-    return None
+    if not r.from_cache:
+        RATE_LIMITER.wait()  # Be polite (cache hits don't touch the server)
+    return LexborHTMLParser(r.text)
+
+# Product pages are cached on disk like SESSION's responses (kept for an
+# hour), so repeat scrapes only hit the network for pages not seen recently
+def make_async_client() -> httpx.AsyncClient:
+    transport = hishel.AsyncCacheTransport(
+        transport=PoliteTransport(httpx.AsyncHTTPTransport(http2=True), RATE_LIMITER),
+        storage=hishel.AsyncFileStorage(base_path=OUT_DIR / "http_cache_pages", ttl=3600),
+        controller=hishel.Controller(force_cache=True),
+    )
+    return httpx.AsyncClient(transport=transport, headers=HEADERS, timeout=30, follow_redirects=True)
+
+async def fetch_soup(client: httpx.AsyncClient, sem: asyncio.Semaphore, url: str) -> LexborHTMLParser:
+    async with sem:
+        r = await client.get(url)
+    r.raise_for_status()
+    return LexborHTMLParser(r.text)
+
+def to_frame(columns: dict[str, list], schema: pa.Schema) -> pd.DataFrame:
+    # Columns are collected as plain lists and converted once via Arrow
+    return pa.table(columns, schema=schema).to_pandas(types_mapper=pd.ArrowDtype)
+
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%b %d, %Y", "%B %d, %Y", "%Y-%m-%d %H:%M:%S")
+
+def parse_dates(raw: pd.Series) -> pd.Series:
+    # Vectorized: one C-level to_datetime pass per known format, first match wins
+    raw = raw.str.strip()
+    parsed = pd.Series(pd.NaT, index=raw.index, dtype="datetime64[ns]")
+    for fmt in DATE_FORMATS:
+        parsed = parsed.fillna(pd.to_datetime(raw, format=fmt, errors="coerce"))
+    return parsed
 
 def scrape_products() -> pd.DataFrame:
     print("Scraping products from all categories...")
-    all_rows = []
+    columns = {name: [] for name in PRODUCTS_SCHEMA.names}
     seen_links = set()  # Track unique products to avoid duplicates
 
     # Scrape each category
@@ -45,7 +138,7 @@ def scrape_products() -> pd.DataFrame:
 
     for category in categories:
         print(f"\n  Category: {category}")
-        rows = []
+        count_before = len(columns["link"])
         url = f"{BASE}/products?category={category}"
         page = 1
 
@@ -54,16 +147,16 @@ def scrape_products() -> pd.DataFrame:
             soup = get_soup(url)
 
             # Find all product cards
-            products = soup.select("div.row.product")
+            products = soup.css("div.row.product")
             print(f"    Found {len(products)} products on page {page}")
 
             for product in products:
                 # Extract product name from h3 a
-                name_el = product.select_one("h3 a")
-                name = name_el.get_text(strip=True) if name_el else None
+                name_el = product.css_first("h3 a")
+                name = name_el.text(strip=True) if name_el else None
 
                 # Extract product link
-                link = name_el.get("href") if name_el else None
+                link = name_el.attributes.get("href") if name_el else None
                 if link and not link.startswith("http"):
                     link = BASE + link
 
@@ -73,26 +166,24 @@ def scrape_products() -> pd.DataFrame:
                 seen_links.add(link)
 
                 # Extract price from div.price
-                price_el = product.select_one("div.price")
-                price = price_el.get_text(strip=True) if price_el else None
+                price_el = product.css_first("div.price")
+                price = price_el.text(strip=True) if price_el else None
 
                 # Extract description
-                desc_el = product.select_one("div.short-description")
-                description = desc_el.get_text(strip=True) if desc_el else None
+                desc_el = product.css_first("div.short-description")
+                description = desc_el.text(strip=True) if desc_el else None
 
-                rows.append({
-                    "name": name,
-                    "price": price,
-                    "link": link,
-                    "description": description,
-                    "category": category,
-                })
+                columns["name"].append(name)
+                columns["price"].append(price)
+                columns["link"].append(link)
+                columns["description"].append(description)
+                columns["category"].append(category)
 
             # Find next page link (look for ">" link in pagination)
             next_link = None
-            for a in soup.select("div.paging a"):
-                if a.get_text(strip=True) == ">":
-                    next_link = a.get("href")
+            for a in soup.css("div.paging a"):
+                if a.text(strip=True) == ">":
+                    next_link = a.attributes.get("href")
                     break
 
             if next_link:
@@ -101,15 +192,14 @@ def scrape_products() -> pd.DataFrame:
             else:
                 url = None
 
-        print(f"    Subtotal for {category}: {len(rows)} products")
-        all_rows.extend(rows)
+        print(f"    Subtotal for {category}: {len(columns['link']) - count_before} products")
 
-    print(f"\nTotal unique products scraped: {len(all_rows)}")
-    return pd.DataFrame(all_rows)
+    print(f"\nTotal unique products scraped: {len(columns['link'])}")
+    return to_frame(columns, PRODUCTS_SCHEMA)
 
 def scrape_testimonials() -> pd.DataFrame:
     print("Scraping testimonials...")
-    rows = []
+    columns = {name: [] for name in TESTIMONIALS_SCHEMA.names}
     url = f"{BASE}/testimonials"
     page = 1
 
@@ -127,35 +217,33 @@ def scrape_testimonials() -> pd.DataFrame:
             soup = get_soup(url, headers=secret_headers)
 
         # Find all testimonial cards
-        testimonials = soup.select("div.testimonial")
+        testimonials = soup.css("div.testimonial")
         print(f"  Found {len(testimonials)} testimonials on page {page}")
 
         for testimonial in testimonials:
             # Extract author from identicon-svg username attribute
-            author_el = testimonial.select_one("identicon-svg")
-            author = author_el.get("username") if author_el else None
+            author_el = testimonial.css_first("identicon-svg")
+            author = author_el.attributes.get("username") if author_el else None
 
             # Extract testimonial text from p.text
-            text_el = testimonial.select_one("p.text")
-            text = text_el.get_text(strip=True) if text_el else None
+            text_el = testimonial.css_first("p.text")
+            text = text_el.text(strip=True) if text_el else None
 
             # Extract rating by counting stars (svg elements)
-            rating_el = testimonial.select_one("span.rating")
-            rating = len(rating_el.select("svg")) if rating_el else None
+            rating_el = testimonial.css_first("span.rating")
+            rating = len(rating_el.css("svg")) if rating_el else None
 
             # Only add if it has actual content (not the trigger element)
             if text:
-                rows.append({
-                    "author": author,
-                    "text": text,
-                    "rating": rating,
-                })
+                columns["author"].append(author)
+                columns["text"].append(text)
+                columns["rating"].append(rating)
 
         # Find next page from HTMX hx-get attribute on last testimonial
         # Look for div.testimonial with hx-get attribute
         next_link = None
-        for testimonial in soup.select("div.testimonial[hx-get]"):
-            hx_get = testimonial.get("hx-get")
+        for testimonial in soup.css("div.testimonial[hx-get]"):
+            hx_get = testimonial.attributes.get("hx-get")
             if hx_get:
                 next_link = hx_get
 
@@ -165,13 +253,40 @@ def scrape_testimonials() -> pd.DataFrame:
         else:
             url = None
 
-    print(f"Total testimonials scraped: {len(rows)}")
-    return pd.DataFrame(rows)
+    print(f"Total testimonials scraped: {len(columns['text'])}")
+    return to_frame(columns, TESTIMONIALS_SCHEMA)
+
+async def fetch_reviews_for(client: httpx.AsyncClient, sem: asyncio.Semaphore, product_url: str) -> dict[str, list]:
+    soup = await fetch_soup(client, sem, product_url)
+
+    # Find the reviews JSON data embedded in the page
+    reviews_script = soup.css_first('script#reviews-data[type="application/json"]')
+
+    if not reviews_script:
+        print(f"    No reviews found on {product_url}")
+        return {name: [] for name in REVIEWS_SCHEMA.names}
+
+    # Parse the JSON
+    try:
+        reviews_json = orjson.loads(reviews_script.text())
+    except Exception as e:
+        print(f"    Error parsing reviews JSON on {product_url}: {e}")
+        return {name: [] for name in REVIEWS_SCHEMA.names}
+
+    # Extract ALL reviews (not filtering by year), one column at a time
+    # Dates are kept raw here and parsed for all reviews at once in scrape_reviews
+    return {
+        "review_id": [r.get("id") for r in reviews_json],
+        "product_url": [product_url] * len(reviews_json),
+        "text": [r.get("text") for r in reviews_json],
+        "rating": [r.get("rating") for r in reviews_json],
+        "date_raw": [r.get("date", "") for r in reviews_json],
+    }
 
-def scrape_reviews(products_df: pd.DataFrame = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+async def scrape_reviews(products_df: pd.DataFrame = None) -> tuple[pd.DataFrame, pd.DataFrame]:
     
     print("Scraping reviews from product pages...")
-    all_rows = []
+    columns = {name: [] for name in REVIEWS_SCHEMA.names}
 
     # Get product URLs (either passed in or scrape them)
     if products_df is None:
@@ -182,89 +297,93 @@ def scrape_reviews(products_df: pd.DataFrame = None) -> tuple[pd.DataFrame, pd.D
 
     print(f"  Found {len(product_links)} products to check for reviews")
 
-    # Visit each product page and extract reviews
-    for idx, product_url in enumerate(product_links, 1):
-        print(f"  [{idx}/{len(product_links)}] Fetching reviews from {product_url}")
-
-        soup = get_soup(product_url)
+    # Visit product pages concurrently and extract reviews
+    sem = asyncio.Semaphore(MAX_IN_FLIGHT)
+    done = 0
 
-        # Find the reviews JSON data embedded in the page
-        reviews_script = soup.find("script", {"id": "reviews-data", "type": "application/json"})
+    async def fetch_one(client: httpx.AsyncClient, url: str) -> dict[str, list]:
+        nonlocal done
+        result = await fetch_reviews_for(client, sem, url)
+        done += 1
+        print(f"  [{done}/{len(product_links)}] {len(result['review_id'])} reviews from {url}")
+        return result
 
-        if not reviews_script:
-            print(f"    No reviews found on this page")
-            continue
+    async with make_async_client() as client:
+        results = await asyncio.gather(*(fetch_one(client, url) for url in product_links))
 
-        # Parse the JSON
-        try:
-            import json
-            reviews_json = json.loads(reviews_script.string)
-        except Exception as e:
-            print(f"    Error parsing reviews JSON: {e}")
-            continue
+    # gather keeps results in product order regardless of completion order
+    for result in results:
+        for name, values in result.items():
+            columns[name].extend(values)
 
-        print(f"    Found {len(reviews_json)} reviews")
+    print(f"Total reviews scraped: {len(columns['review_id'])}")
 
-        # Extract ALL reviews (not filtering by year)
-        for review in reviews_json:
-            date_raw = review.get("date", "")
-            date_parsed = parse_date(date_raw) if date_raw else None
-
-            # Determine if review is from 2023
-            is_from_2023 = date_parsed is not None and date_parsed.year == 2023
-
-            all_rows.append({
-                "review_id": review.get("id"),
-                "product_url": product_url,
-                "text": review.get("text"),
-                "rating": review.get("rating"),
-                "date_raw": date_raw,
-                "date": date_parsed,
-                "is_from_2023": is_from_2023,
-            })
-
-    print(f"Total reviews scraped: {len(all_rows)}")
-
-    # Convert to DataFrame and ensure date column is datetime
-    all_reviews_df = pd.DataFrame(all_rows)
-    if not all_reviews_df.empty:
-        all_reviews_df["date"] = pd.to_datetime(all_reviews_df["date"], errors="coerce")
+    # Convert to DataFrame and parse all dates in one pass
+    all_reviews_df = to_frame(columns, REVIEWS_SCHEMA)
+    all_reviews_df["date"] = parse_dates(all_reviews_df["date_raw"])
 
     # Create filtered DataFrame with only 2023 reviews
-    reviews_2023_df = all_reviews_df[all_reviews_df["is_from_2023"] == True].copy()
+    reviews_2023_df = all_reviews_df.iloc[all_reviews_df["date"].dt.year.eq(2023).to_numpy()]
     print(f"2023 reviews: {len(reviews_2023_df)}")
 
     return all_reviews_df, reviews_2023_df
 
+# Sentiment is precomputed here so app.py doesn't have to run the model.
+# Predictions are reused from the sha1(text) cache shared with app.py, so a
+# re-scrape only runs the model on reviews it hasn't seen before.
+def score_reviews(reviews_df: pd.DataFrame, batch_size: int = 32) -> pd.DataFrame:
+    from sentiment import load_model, predict_sentiment, predict_with_cache
+
+    print(f"Scoring sentiment for {len(reviews_df)} reviews...")
+    reviews_df = reviews_df.copy()
+    if reviews_df.empty:
+        reviews_df["sentiment"] = pd.Series(dtype=str)
+        reviews_df["confidence"] = pd.Series(dtype=float)
+        return reviews_df
+
+    texts = reviews_df["text"].fillna("").astype(str).tolist()
+    # The model is only loaded if some texts are missing from the cache
+    preds = predict_with_cache(
+        texts,
+        lambda missing: predict_sentiment(missing, *load_model(), batch_size=batch_size),
+    )
+
+    reviews_df["sentiment"] = [p["label"] for p in preds]
+    reviews_df["confidence"] = [p["score"] for p in preds]
+    return reviews_df
+
 def main():
     print("Starting web scraping...")
     print("=" * 60)
 
     # Scrape products
     products = scrape_products()
-    products_file = OUT_DIR / "products.csv"
-    products.to_csv(products_file, index=False)
+    products_file = OUT_DIR / "products.parquet"
+    products.to_parquet(products_file, index=False, compression="zstd")
     print(f"✓ Saved {len(products)} products to {products_file}")
     print()
 
     # Scrape testimonials
     testimonials = scrape_testimonials()
-    testimonials_file = OUT_DIR / "testimonials.csv"
-    testimonials.to_csv(testimonials_file, index=False)
+    testimonials_file = OUT_DIR / "testimonials.parquet"
+    testimonials.to_parquet(testimonials_file, index=False, compression="zstd")
     print(f"✓ Saved {len(testimonials)} testimonials to {testimonials_file}")
     print()
 
     # Scrape reviews (pass products to avoid re-scraping)
-    all_reviews, reviews_2023 = scrape_reviews(products_df=products)
+    all_reviews, reviews_2023 = asyncio.run(scrape_reviews(products_df=products))
 
-    # Save all reviews with is_from_2023 flag
-    all_reviews_file = OUT_DIR / "reviews_all.csv"
-    all_reviews.to_csv(all_reviews_file, index=False)
+    # Save all reviews
+    all_reviews_file = OUT_DIR / "reviews_all.parquet"
+    all_reviews.to_parquet(all_reviews_file, index=False, compression="zstd")
     print(f"✓ Saved {len(all_reviews)} reviews (all years) to {all_reviews_file}")
 
+    # Precompute sentiment for 2023 reviews
+    reviews_2023 = score_reviews(reviews_2023)
+
     # Save 2023 reviews only
-    reviews_file = OUT_DIR / "reviews.csv"
-    reviews_2023.to_csv(reviews_file, index=False)
+    reviews_file = OUT_DIR / "reviews.parquet"
+    reviews_2023.to_parquet(reviews_file, index=False, compression="zstd")
     print(f"✓ Saved {len(reviews_2023)} reviews (2023 only) to {reviews_file}")
     print()
 
@@ -273,8 +392,8 @@ def main():
     print(f"All files saved to: {OUT_DIR.absolute()}")
     print(f"  - {products_file.name}")
     print(f"  - {testimonials_file.name}")
-    print(f"  - {all_reviews_file.name} (all reviews with is_from_2023 flag)")
-    print(f"  - {reviews_file.name} (2023 reviews only)")
+    print(f"  - {all_reviews_file.name} (all reviews)")
+    print(f"  - {reviews_file.name} (2023 reviews only, with sentiment)")
 
 if __name__ == "__main__":
     main()
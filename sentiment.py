@@ -0,0 +1,154 @@
+# sentiment.py
+from __future__ import annotations
+from pathlib import Path
+import hashlib
+import os
+import tempfile
+
+import pandas as pd
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer, DataCollatorWithPadding
+
+MODEL_NAME = "distilbert-base-uncased-finetuned-sst-2-english"
+INT8_MODEL_DIR = Path("data") / "distilbert-int8"
+INT8_MODEL_FILE = "model_quantized.onnx"
+SENT_CACHE_DIR = Path("data")
+
+# Batches are padded to a multiple of PAD_MULTIPLE tokens, so the compiled
+# model only ever sees MAX_LENGTH // PAD_MULTIPLE sequence lengths
+MAX_LENGTH = 256
+PAD_MULTIPLE = 32
+
+# Several small instances with a few threads each beat one instance on all
+# cores (better cache locality), so each process is capped at this many threads
+THREADS_PER_WORKER = 4
+
+# Model loaded by init_worker in each ProcessPoolExecutor worker
+_worker_model = None
+
+def set_threads(n: int = THREADS_PER_WORKER):
+    torch.set_num_threads(n)
+
+# Same rules as load_model: FP16 on GPU, otherwise INT8 ONNX or FP32 on CPU
+def backend_name() -> str:
+    if torch.cuda.is_available():
+        return "cuda-fp16"
+    if (INT8_MODEL_DIR / INT8_MODEL_FILE).exists():
+        return "cpu-int8"
+    return "cpu-fp32"
+
+# Returns (tokenizer, model, device); callers cache the result.
+# num_threads caps ONNX Runtime's own thread pool, which ignores set_threads
+def load_model(num_threads: int | None = None):
+    # On CPU-only hosts prefer the INT8 ONNX model (created by export_onnx.py)
+    if not torch.cuda.is_available() and (INT8_MODEL_DIR / INT8_MODEL_FILE).exists():
+        try:
+            import onnxruntime
+            from optimum.onnxruntime import ORTModelForSequenceClassification
+            session_options = None
+            if num_threads is not None:
+                session_options = onnxruntime.SessionOptions()
+                session_options.intra_op_num_threads = num_threads
+                session_options.inter_op_num_threads = 1
+            model = ORTModelForSequenceClassification.from_pretrained(
+                INT8_MODEL_DIR, file_name=INT8_MODEL_FILE, session_options=session_options,
+            )
+            return AutoTokenizer.from_pretrained(INT8_MODEL_DIR), model, "cpu"
+        except Exception:
+            pass
+
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    # GPU with FP16 if available, otherwise CPU
+    model, device = None, "cpu"
+    if torch.cuda.is_available():
+        try:
+            model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME, torch_dtype=torch.float16)
+            model, device = model.to("cuda").eval(), "cuda"
+        except Exception:
+            model = None
+    if model is None:
+        model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME).eval()
+
+    # torch.compile + warm-up of every padded length, so the first real batch
+    # doesn't pay for compilation (or CUDA graph recording)
+    try:
+        compiled = torch.compile(model, mode="reduce-overhead", fullgraph=False, dynamic=True)
+        with torch.inference_mode():
+            for length in range(PAD_MULTIPLE, MAX_LENGTH + 1, PAD_MULTIPLE):
+                dummy = torch.full((32, length), tokenizer.pad_token_id, dtype=torch.long, device=device)
+                compiled(input_ids=dummy, attention_mask=torch.ones_like(dummy))
+        model = compiled
+    except Exception:
+        pass
+    return tokenizer, model, device
+
+@torch.inference_mode()
+def predict_sentiment(texts: list[str], tokenizer, model, device: str, batch_size: int = 32) -> list[dict]:
+    id2label = model.config.id2label
+    # Tokenize once to get true token counts, then bucket by length so each
+    # batch is padded only to its own longest sequence
+    encoded = tokenizer(list(texts), truncation=True, max_length=MAX_LENGTH)
+    order = sorted(range(len(texts)), key=lambda i: len(encoded["input_ids"][i]))
+    collate = DataCollatorWithPadding(tokenizer, padding="longest", pad_to_multiple_of=PAD_MULTIPLE, return_tensors="pt")
+    preds = [None] * len(texts)
+    for start in range(0, len(order), batch_size):
+        bucket = order[start:start + batch_size]
+        inputs = collate([{key: encoded[key][i] for key in encoded.keys()} for i in bucket]).to(device)
+        probs = torch.softmax(model(**inputs).logits.float(), dim=-1)
+        scores, labels = probs.max(dim=-1)
+        # Write results back in the original order
+        for i, l, sc in zip(bucket, labels.tolist(), scores.tolist()):
+            preds[i] = {"label": id2label[int(l)], "score": float(sc)}
+    return preds
+
+def init_worker():
+    global _worker_model
+    set_threads()
+    _worker_model = load_model(num_threads=THREADS_PER_WORKER)
+
+def predict_in_worker(texts: list[str], batch_size: int = 32) -> list[dict]:
+    return predict_sentiment(texts, *_worker_model, batch_size=batch_size)
+
+def predict_sentiment_parallel(executor, n_workers: int, texts: list[str], batch_size: int = 32) -> list[dict]:
+    # One contiguous chunk per worker; results come back in input order
+    chunk_size = -(-len(texts) // n_workers)
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    preds = []
+    for chunk_preds in executor.map(predict_in_worker, chunks, [batch_size] * len(chunks)):
+        preds.extend(chunk_preds)
+    return preds
+
+# One cache file per backend, so scores from different models never mix
+def sent_cache_path(backend: str) -> Path:
+    return SENT_CACHE_DIR / f"sent_cache_{backend}.parquet"
+
+def save_sent_cache(path: Path, cache: pd.DataFrame):
+    # Write to a temp file and swap it in, so concurrent writers can't corrupt it
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".parquet.tmp")
+    os.close(fd)
+    try:
+        cache.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+# Looks up sha1(text) in the on-disk cache and calls predict_fn only for the misses
+def predict_with_cache(texts: list[str], predict_fn) -> list[dict]:
+    keys = [hashlib.sha1(t.encode("utf-8")).hexdigest() for t in texts]
+    cache_path = sent_cache_path(backend_name())
+    cache = pd.read_parquet(cache_path) if cache_path.exists() else pd.DataFrame(columns=["key", "label", "score"])
+    known = dict(zip(cache["key"], zip(cache["label"], cache["score"])))
+
+    missing = list({k: t for k, t in zip(keys, texts) if k not in known}.items())
+    if missing:
+        preds = predict_fn([t for _, t in missing])
+        new_rows = pd.DataFrame({
+            "key": [k for k, _ in missing],
+            "label": [p["label"] for p in preds],
+            "score": [p["score"] for p in preds],
+        })
+        known.update(zip(new_rows["key"], zip(new_rows["label"], new_rows["score"])))
+        save_sent_cache(cache_path, pd.concat([cache, new_rows], ignore_index=True))
+
+    return [{"label": known[k][0], "score": float(known[k][1])} for k in keys]